@@ -21,10 +21,9 @@ def add_line_numbers(source: str, width: int = 3) -> str:
     Example output line:
         001: int main() {
     """
-    numbered_lines = []
-    for i, line in enumerate(source.splitlines(), start=1):
-        numbered_lines.append(f"{i:0{width}d}: {line}")
-    return "\n".join(numbered_lines)
+    return "\n".join(
+        [f"{i:0{width}d}: {line}" for i, line in enumerate(source.splitlines(), start=1)]
+    )
 
 
 def build_trace_prompt(source: str, file_name: str, target_line: int) -> str:
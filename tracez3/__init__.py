@@ -4,6 +4,7 @@ from .trace import (  # noqa: F401
     TraceRewardResult,
     TraceTask,
     evaluate_trace,
+    evaluate_trace_batch,
     parse_trace_block,
 )
 
@@ -13,5 +14,6 @@ __all__ = [
     "TraceRewardResult",
     "TraceTask",
     "evaluate_trace",
+    "evaluate_trace_batch",
     "parse_trace_block",
 ]
@@ -1,205 +1,171 @@
-import json
-import random
-import subprocess
-from pathlib import Path
-from z3 import Ints, Solver, And, Not, If, BoolVal, sat
+import functools
+import itertools
+from types import MappingProxyType
 
-from .reward_utils import branch_truth_from_coverage, trace_f1
+from . import control_temp
+from .reward_utils import branch_truth_from_coverage, collect_executed_lines, trace_f1
 
 MIN_REWARD = -1.0
 
-def convert_c_lines_to_py_lines(trace):
-    """
-    trace: list[(line, dir)], dir in {'T', 'F'}
-    return: list[(line, dir)], dir in {'T', 'F'}
-    """
-    C_TO_PY = {
-        13: 10,
-        15: 12,
-        20: 16,
-        23: 19,
-        31: 26,
-        35: 30,
-        42: 34,
-        44: 36,
-        51: 41,
-        57: 46
-    }
-    result = []
-    for ln, d in trace:
-        if ln not in C_TO_PY:
-            raise RuntimeError(f'line {ln} is not an if')
-        result.append((C_TO_PY[ln], d))
-    return result
+# Shared fields of every rejected verdict; each return adds its reason.
+_REJECTED = MappingProxyType({'sat': False, 'reward': MIN_REWARD})
 
+# _LINE_INDEX maps each if-line of control_temp.py to its condition's slot.
+_LINE_INDEX = {10: 0, 12: 1, 16: 2, 19: 3, 26: 4, 30: 5, 34: 6, 36: 7, 41: 8, 46: 9}
 
-def verify_trace(trace, target_line=47):
+
+def _branch_conditions(mode, temp, user_level, emergency):
     """
-    trace: list[(line, dir)], dir in {'T', 'F'}
-    target_line: target line
-    return: dict(sat: bool, reward: float, reason: str)
+    return: the value of every if condition of control_temp.control on the
+            given inputs, by slot, whether or not that if is reached
     """
-
-    # 1. invalid if lines
-    try:
-        trace = convert_c_lines_to_py_lines(trace)
-    except RuntimeError as e:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': str(e)
-        }
-
-    s = Solver()
-
-    mode, temp, user_level, emergency = Ints('mode temp user_level emergency')
-    s.add(emergency >= 0, emergency <= 1)
-
-    sensor_ok = BoolVal(True)
-    mode_is_1 = mode == 1
-    mode_is_2 = mode == 2
-    temp_high = And(temp > 30, sensor_ok)
+    sensor_ok = True
+    temp_high = temp > 30 and sensor_ok
     user_ge_5 = user_level >= 5
     user_ge_10 = user_level >= 10
-    temp_comfort = And(And(temp >= 18, temp <= 26), sensor_ok)
-    emergency_active = emergency == 1
+    temp_comfort = 18 <= temp <= 26 and sensor_ok
 
-    open_after_mode = If(
-        mode_is_1,
+    if mode == 1:
+        open_, locked = temp_high, False
+    elif mode == 2:
+        open_, locked = user_ge_5, not user_ge_5
+    else:
+        open_, locked = temp_comfort, False
+    if emergency:
+        open_ = user_ge_10
+        locked = locked and not user_ge_10
+
+    return (
+        mode == 1,
         temp_high,
-        If(
-            mode_is_2,
-            user_ge_5,
-            temp_comfort
-        )
-    )
-    locked_after_mode = If(
-        mode_is_2,
-        Not(user_ge_5),
-        BoolVal(False)
+        mode == 2,
+        user_ge_5,
+        not sensor_ok,
+        temp_comfort,
+        bool(emergency),
+        user_ge_10,
+        locked,
+        open_ and not locked,
     )
 
-    open_after_emergency = If(
-        emergency_active,
-        If(user_ge_10, BoolVal(True), BoolVal(False)),
-        open_after_mode
-    )
-    locked_after_emergency = If(
-        emergency_active,
-        If(user_ge_10, BoolVal(False), locked_after_mode),
-        locked_after_mode
-    )
 
-    final_open = If(locked_after_emergency, BoolVal(False), open_after_emergency)
-
-    cond_map = {
-        10: mode_is_1,
-        12: temp_high,
-        16: mode_is_2,
-        19: user_ge_5,
-        26: Not(sensor_ok),
-        30: temp_comfort,
-        34: emergency_active,
-        36: user_ge_10,
-        41: locked_after_emergency,
-        46: final_open,
+# Line of each if in control_temp.c -> the same if in control_temp.py
+_C_TO_PY = MappingProxyType({
+    13: 10,
+    15: 12,
+    20: 16,
+    23: 19,
+    31: 26,
+    35: 30,
+    42: 34,
+    44: 36,
+    51: 41,
+    57: 46
+})
+_PY_TO_C = MappingProxyType({py: c for c, py in _C_TO_PY.items()})
+_DIRECTIONS = ('T', 'F')
+
+# If entered the if, i.e., the next line, set it to Taken
+_TRUE_LINE_MAP = MappingProxyType({
+    10: 11,
+    12: 13,
+    16: 17,
+    19: 20,
+    26: 27,
+    30: 31,
+    34: 35,
+    36: 37,
+    41: 42,
+    46: 47
+})
+
+# Every branch in control_temp.control compares an input against a fixed
+# threshold, so the inputs fall into a few classes that take the same path.
+# Each class is named by one representative input and traced once at import.
+_MODE_CLASSES = (1, 2, 3)          # == 1, == 2, anything else
+_TEMP_CLASSES = (17, 18, 27, 31)   # < 18, 18..26, 27..30, > 30
+_USER_LEVEL_CLASSES = (4, 5, 10)   # < 5, 5..9, >= 10
+_EMERGENCY_CLASSES = (False, True)
+
+
+_CLASSES = tuple(itertools.product(
+    _MODE_CLASSES, _TEMP_CLASSES, _USER_LEVEL_CLASSES, _EMERGENCY_CLASSES
+))
+
+# Traces arrive as control_temp.c lines, so the truth rows are keyed by the
+# C line of each if.
+_TRUTH_TABLE = {
+    inputs: {
+        _PY_TO_C[ln]: truth
+        for ln, truth in branch_truth_from_coverage(
+            collect_executed_lines(control_temp.control, *inputs),
+            _TRUE_LINE_MAP,
+        ).items()
     }
+    for inputs in _CLASSES
+}
+
+
+# The classes decide every condition, so each condition (and the target) is
+# kept as the set of classes satisfying it (bit i <-> _CLASSES[i]).  A trace
+# is satisfiable iff the AND of its literals' sets is non-empty, and the
+# witness is the first class left in _CLASSES order, so the reward never
+# depends on which model a solver happens to return.
+_ALL_CLASSES = (1 << len(_CLASSES)) - 1
+_CLASS_CONDITIONS = tuple(_branch_conditions(*inputs) for inputs in _CLASSES)
+_COND_MASKS = {
+    c_line: sum(
+        1 << bit
+        for bit, conds in enumerate(_CLASS_CONDITIONS)
+        if conds[_LINE_INDEX[py_line]]
+    )
+    for c_line, py_line in _C_TO_PY.items()
+}
+# Line 47 runs iff the last if (line 57 in C, the door ends up open) is taken.
+_TARGET_MASK = _COND_MASKS[57]
+
+
+def _invalid_literal(trace):
+    """
+    trace: list[(line, dir)] of control_temp.c lines
+    return: reason for the first literal that is not an if line / direction, or None
+    """
 
     for ln, d in trace:
-        cond = cond_map[ln]
-        if d == 'T':
-            s.add(cond)
-        else:
-            s.add(Not(cond))
-
-    if target_line == 47:
-        s.add(final_open)
-    else:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': f'unsupported target line {target_line}'
-        }
+        if ln not in _C_TO_PY:
+            return f'line {ln} is not an if'
+        if d not in _DIRECTIONS:
+            return f'invalid direction {d!r} at line {ln}'
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _verify_trace_cached(trace, target_line):
+    """
+    trace: tuple[(line, dir)] of control_temp.c lines, dir in {'T', 'F'}
+    target_line: target line
+    return: dict(sat: bool, reward: float, reason: str), shared by all callers
+    """
+
+    # 1. invalid if lines
+    reason = _invalid_literal(trace)
+    if reason is not None:
+        return {**_REJECTED, 'reason': reason}
+
+    if target_line != 47:
+        return {**_REJECTED, 'reason': f'unsupported target line {target_line}'}
 
     # 5. SAT / UNSAT
-    if s.check() != sat:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': 'unsatisfiable trace'
-        }
-
-    # 6. coverage based method scoring (f1)
-
-    m = s.model()
-    mode_val = m[mode].as_long() if m[mode] is not None else random.randint(1,3)
-    temp_val = m[temp].as_long() if m[temp] is not None else 999
-    user_level_val = m[user_level].as_long() if m[user_level] is not None else 999
-    emergency_val = m[emergency].as_long() if m[temp] is not None else bool(random.randint(0,1))
-
-    script_dir = Path(__file__).resolve().parent
-    coverage_file = script_dir / '.coverage'
-    coverage_json = script_dir / 'coverage.json'
-    control_temp_py = script_dir / 'control_temp.py'
-
-    coverage_file.unlink(missing_ok=True)
-    coverage_json.unlink(missing_ok=True)
-
-    try:
-        subprocess.run(
-            [
-                'coverage',
-                'run',
-                str(control_temp_py),
-                str(mode_val),
-                str(temp_val),
-                str(user_level_val),
-                str(emergency_val),
-            ],
-            check=True,
-            cwd=script_dir,
-        )
-        subprocess.run(['coverage', 'json'], check=True, cwd=script_dir)
-    except subprocess.CalledProcessError as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'coverage failed: {exc}',
-        }
-
-    if not coverage_json.exists():
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': 'coverage report missing',
-        }
-
-    try:
-        with coverage_json.open('r', encoding='utf-8') as fp:
-            data = json.load(fp)
-        executed_lines = set(data['files']['control_temp.py']['executed_lines'])
-    except (OSError, KeyError, json.JSONDecodeError) as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'failed to parse coverage: {exc}',
-        }
-
-    # If entered the if, i.e., the next line, set it to Taken
-    true_line_map = {
-        10: 11,
-        12: 13,
-        16: 17,
-        19: 20,
-        26: 27,
-        30: 31,
-        34: 35,
-        36: 37,
-        41: 42,
-        46: 47
-    }
+    classes = _TARGET_MASK
+    for ln, d in trace:
+        cond = _COND_MASKS[ln]
+        classes &= cond if d == 'T' else _ALL_CLASSES ^ cond
+        if not classes:
+            return {**_REJECTED, 'reason': 'unsatisfiable trace'}
+
+    # 6. coverage based method scoring (f1), looked up per input class
 
-    actual_truth = branch_truth_from_coverage(executed_lines, true_line_map)
+    actual_truth = _TRUTH_TABLE[_CLASSES[(classes & -classes).bit_length() - 1]]
     reward = trace_f1(trace, actual_truth)
 
     return {
@@ -208,6 +174,35 @@ def verify_trace(trace, target_line=47):
         'reason': 'ok'
     }
 
+
+def verify_trace(trace, target_line=47):
+    """
+    trace: list[(line, dir)], dir in {'T', 'F'}
+    target_line: target line
+    return: dict(sat: bool, reward: float, reason: str)
+    """
+
+    if not trace:
+        return {**_REJECTED, 'reason': 'empty trace'}
+
+    # The policy keeps re-emitting the same traces, so results are memoized on
+    # the hashable form of the arguments; callers get their own copy.  A
+    # verdict depends only on those arguments, so an entry evicted from the
+    # cache is recomputed to the same result.
+    key = tuple((ln, d) for ln, d in trace)
+    return dict(_verify_trace_cached(key, target_line))
+
+def verify_batch(traces, target_line=47):
+    """
+    traces: list of traces, each list[(line, dir)], dir in {'T', 'F'}
+    target_line: target line
+    return: list[dict(sat: bool, reward: float, reason: str)], in input order
+    """
+
+    # Repeated traces inside the batch are served by the verify_trace cache.
+    return [verify_trace(trace, target_line) for trace in traces]
+
+
 if __name__ == '__main__':
     print(verify_trace(
         [
@@ -1,134 +1,98 @@
-import json
-import subprocess
-from pathlib import Path
-from z3 import Ints, Solver, Not, sat
+import functools
+from types import MappingProxyType
 
-from .reward_utils import branch_truth_from_coverage, trace_f1
+from . import dummy
+from .reward_utils import branch_truth_from_coverage, collect_executed_lines, trace_f1
 
 MIN_REWARD = -1.0
 
-def convert_c_lines_to_py_lines(trace):
+# Shared fields of every rejected verdict; each return adds its reason.
+_REJECTED = MappingProxyType({'sat': False, 'reward': MIN_REWARD})
+
+# Line of each if in dummy.c -> the same if in dummy.py
+_C_TO_PY = MappingProxyType({
+    3: 3,
+    5: 5
+})
+_PY_TO_C = MappingProxyType({py: c for c, py in _C_TO_PY.items()})
+_DIRECTIONS = ('T', 'F')
+
+# If entered the if, i.e., the next line, set it to Taken
+_TRUE_LINE_MAP = MappingProxyType({
+    3: 4,
+    5: 6,
+})
+
+
+# dummy.dummy only tests value == 1 and value == 2, so three classes exist,
+# named by the representatives in _VALUES.  Each condition is the 3-bit set
+# of classes satisfying it (bit i <-> _VALUES[i]), keyed by its dummy.c line,
+# and a trace is satisfiable iff the AND of its literals' sets is non-empty.
+_VALUES = (1, 2, 3)  # == 1, == 2, anything else
+_ALL_VALUES = 0b111
+
+_COND_MASKS = {
+    3: 0b001,  # value == 1
+    5: 0b010,  # value == 2
+}
+# Line 8 is only reached when both ifs fall through.
+_TARGET_MASK = 0b100
+
+# Branch outcomes of each class, traced once at import and keyed by the
+# dummy.c line of each if.
+_TRUTH_TABLE = {
+    value: {
+        _PY_TO_C[ln]: truth
+        for ln, truth in branch_truth_from_coverage(
+            collect_executed_lines(dummy.dummy, value),
+            _TRUE_LINE_MAP,
+        ).items()
+    }
+    for value in _VALUES
+}
+
+
+def _invalid_literal(trace):
     """
-    trace: list[(line, dir)], dir in {'T', 'F'}
-    return: list[(line, dir)], dir in {'T', 'F'}
+    trace: list[(line, dir)] of dummy.c lines
+    return: reason for the first literal that is not an if line / direction, or None
     """
-    C_TO_PY = {
-        3: 3,
-        5: 5
-    }
-    result = []
+
     for ln, d in trace:
-        if ln not in C_TO_PY:
-            raise RuntimeError(f'line {ln} is not an if')
-        result.append((C_TO_PY[ln], d))
-    return result
+        if ln not in _C_TO_PY:
+            return f'line {ln} is not an if'
+        if d not in _DIRECTIONS:
+            return f'invalid direction {d!r} at line {ln}'
+    return None
 
 
-def verify_trace(trace, target_line=8):
+@functools.lru_cache(maxsize=4096)
+def _verify_trace_cached(trace, target_line):
     """
-    trace: list[(line, dir)], dir in {'T', 'F'}
+    trace: tuple[(line, dir)] of dummy.c lines, dir in {'T', 'F'}
     target_line: target line
-    return: dict(sat: bool, reward: float, reason: str)
+    return: dict(sat: bool, reward: float, reason: str), shared by all callers
     """
 
     # 1. invalid if lines
-    try:
-        trace = convert_c_lines_to_py_lines(trace)
-    except RuntimeError as e:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': str(e)
-        }
-
-    s = Solver()
+    reason = _invalid_literal(trace)
+    if reason is not None:
+        return {**_REJECTED, 'reason': reason}
 
-    value, = Ints('value')
-
-    cond3 = value == 1
-    cond5 = value == 2
-
-    cond_map = {
-        3: cond3,
-        5: cond5,
-    }
+    if target_line != 8:
+        return {**_REJECTED, 'reason': f'unsupported target line {target_line}'}
 
+    # 5. SAT / UNSAT
+    classes = _TARGET_MASK
     for ln, d in trace:
-        cond = cond_map[ln]
-        if d == 'T':
-            s.add(cond)
-        else:
-            s.add(Not(cond))
-
-    if target_line == 8:
-        s.add(Not(cond3), Not(cond5))
-    else:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': f'unsupported target line {target_line}'
-        }
+        cond = _COND_MASKS[ln]
+        classes &= cond if d == 'T' else _ALL_VALUES ^ cond
+        if not classes:
+            return {**_REJECTED, 'reason': 'unsatisfiable trace'}
 
-    # 5. SAT / UNSAT
-    if s.check() != sat:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': 'unsatisfiable trace'
-        }
-
-    # 6. coverage based method scoring (f1)
-
-    m = s.model()
-    value_val = m[value].as_long()
-
-    script_dir = Path(__file__).resolve().parent
-    coverage_file = script_dir / '.coverage'
-    coverage_json = script_dir / 'coverage.json'
-    dummy_py = script_dir / 'dummy.py'
-
-    coverage_file.unlink(missing_ok=True)
-    coverage_json.unlink(missing_ok=True)
-
-    try:
-        subprocess.run(
-            ['coverage', 'run', str(dummy_py), str(value_val)],
-            check=True,
-            cwd=script_dir,
-        )
-        subprocess.run(['coverage', 'json'], check=True, cwd=script_dir)
-    except subprocess.CalledProcessError as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'coverage failed: {exc}',
-        }
-
-    if not coverage_json.exists():
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': 'coverage report missing',
-        }
-
-    try:
-        with coverage_json.open('r', encoding='utf-8') as fp:
-            data = json.load(fp)
-        executed_lines = set(data['files']['dummy.py']['executed_lines'])
-    except (OSError, KeyError, json.JSONDecodeError) as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'failed to parse coverage: {exc}',
-        }
-
-    # If entered the if, i.e., the next line, set it to Taken
-    true_line_map = {
-        3: 4,
-        5: 6,
-    }
+    # 6. coverage based method scoring (f1), looked up per input class
 
-    actual_truth = branch_truth_from_coverage(executed_lines, true_line_map)
+    actual_truth = _TRUTH_TABLE[_VALUES[(classes & -classes).bit_length() - 1]]
     reward = trace_f1(trace, actual_truth)
 
     return {
@@ -137,6 +101,24 @@ def verify_trace(trace, target_line=8):
         'reason': 'ok'
     }
 
+
+def verify_trace(trace, target_line=8):
+    """
+    trace: list[(line, dir)], dir in {'T', 'F'}
+    target_line: target line
+    return: dict(sat: bool, reward: float, reason: str)
+    """
+
+    if not trace:
+        return {**_REJECTED, 'reason': 'empty trace'}
+
+    # The policy keeps re-emitting the same traces, so results are memoized on
+    # the hashable form of the arguments; callers get their own copy.  A
+    # verdict depends only on those arguments, so an entry evicted from the
+    # cache is recomputed to the same result.
+    key = tuple((ln, d) for ln, d in trace)
+    return dict(_verify_trace_cached(key, target_line))
+
 if __name__ == '__main__':
     print(verify_trace(
         [
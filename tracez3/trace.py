@@ -9,8 +9,12 @@ benchmarks included in this repository:
 
 Each task produces a system/user prompt pair that instructs the model to emit a
 branch trace inside a `````trace`` code fence. The emitted trace is parsed and
-scored by the corresponding ``verify_trace`` helper which combines symbolic
-execution and coverage information to deliver a dense reward.  The resulting
+scored by the corresponding ``verify_trace`` helper.  Each benchmark's inputs
+fall into a few classes that take the same path; at import every class is run
+once under a line tracer to record its branch outcomes, and each branch
+condition is kept as the set of classes satisfying it.  A trace is feasible
+iff some class satisfies all of its decisions and reaches the target, and the
+first such class's branch outcomes give the dense (F1) reward.  The resulting
 environment can be plugged into an Unsloth GRPO trainer by feeding the
 ``messages`` returned by :class:`TraceRLEnvironment` into the policy model and
 passing the generated text back to :meth:`TraceRLEnvironment.evaluate`.
@@ -19,18 +23,24 @@ passing the generated text back to :meth:`TraceRLEnvironment.evaluate`.
 from __future__ import annotations
 
 import random
-import re
+from concurrent.futures import Executor
 from dataclasses import dataclass
+from itertools import repeat
 from pathlib import Path
 from textwrap import dedent
 from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
 
+from .control_temp_z3 import verify_batch as verify_control_temp_batch
 from .control_temp_z3 import verify_trace as verify_control_temp_trace
 from .dummy_z3 import verify_trace as verify_dummy_trace
+from .xor_z3 import verify_batch as verify_xor_batch
 from .xor_z3 import verify_trace as verify_xor_trace
 
 TraceDecision = Tuple[int, str]
 VerifyTraceFn = Callable[[Sequence[TraceDecision], int], Mapping[str, object]]
+VerifyTraceBatchFn = Callable[
+    [Sequence[Sequence[TraceDecision]], int], Sequence[Mapping[str, object]]
+]
 
 TRACE_SYSTEM_PROMPT = dedent(
     """
@@ -75,6 +85,18 @@ TRACE_SYSTEM_PROMPT = dedent(
     """
 ).strip()
 
+_USER_PROMPT_TEMPLATE = dedent(
+    """
+    File name: {file_name}
+    Target line: {target_line}
+
+    Program listing:
+    ```
+    {numbered}
+    ```
+    """
+).strip()
+
 
 @dataclass(frozen=True)
 class TraceTask:
@@ -85,25 +107,35 @@ class TraceTask:
     target_line: int
     source: str
     verifier: VerifyTraceFn
+    batch_verifier: Optional[VerifyTraceBatchFn] = None
+
+    def __post_init__(self) -> None:
+        # Every field is frozen, so the user prompt and the default
+        # conversation are rendered once and handed out from then on.  The
+        # message dicts are shared and must not be mutated.
+        user_prompt = _USER_PROMPT_TEMPLATE.format(
+            file_name=self.file_name,
+            target_line=self.target_line,
+            numbered=add_line_numbers(self.source),
+        )
+        object.__setattr__(self, "_user_prompt", user_prompt)
+        object.__setattr__(
+            self,
+            "_conversation",
+            (
+                {"role": "system", "content": TRACE_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ),
+        )
 
     def build_user_prompt(self) -> str:
-        numbered = add_line_numbers(self.source)
-        return dedent(
-            f"""File name: {self.file_name}
-Target line: {self.target_line}
-
-Program listing:
-```
-{numbered}
-```
-            """
-        ).strip()
+        return self._user_prompt
 
     def as_conversation(self, system_prompt: str = TRACE_SYSTEM_PROMPT) -> List[Dict[str, str]]:
-        return [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": self.build_user_prompt()},
-        ]
+        system_message, user_message = self._conversation
+        if system_prompt != TRACE_SYSTEM_PROMPT:
+            system_message = {"role": "system", "content": system_prompt}
+        return [system_message, user_message]
 
 
 @dataclass(frozen=True)
@@ -126,34 +158,77 @@ class TraceParseError(ValueError):
     """Raised when the model output cannot be parsed into a trace."""
 
 
-TRACE_BLOCK_RE = re.compile(r"```trace\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+TRACE_FENCE = "```"
+TRACE_TAG = "trace"
+BRANCH_TOKENS = {"T": "T", "t": "T", "F": "F", "f": "F"}
 MIN_REWARD = -1.0
 
 
 def add_line_numbers(source: str, width: int = 3) -> str:
-    """Return the program with 1-based line numbers."""
+    """Return the program with 1-based line numbers zero-padded to ``width``."""
+
+    return "\n".join(
+        [f"{idx:0{width}d}: {line}" for idx, line in enumerate(source.splitlines(), start=1)]
+    )
+
+
+def _find_trace_block(text: str) -> Optional[str]:
+    """Return the body of the first ```trace fence in ``text``, if any.
+
+    Behaves like ``re.search(r"```trace\\s*(.*?)```", text, re.DOTALL | re.I)``
+    but scans with ``str.find``, so it never backtracks.
+    """
 
-    numbered_lines: List[str] = []
-    for idx, line in enumerate(source.splitlines(), start=1):
-        numbered_lines.append(f"{idx: {width}d}: {line}")
-    return "\n".join(numbered_lines)
+    start = text.find(TRACE_FENCE)
+    while start != -1:
+        tag_end = start + len(TRACE_FENCE) + len(TRACE_TAG)
+        if text[start + len(TRACE_FENCE):tag_end].lower() == TRACE_TAG:
+            end = text.find(TRACE_FENCE, tag_end)
+            # No closing fence after the first opener means none after a
+            # later opener either.
+            return text[tag_end:end] if end != -1 else None
+        start = text.find(TRACE_FENCE, start + 1)
+    return None
+
+
+def _invalid_decision_error(lines: Sequence[str]) -> TraceParseError:
+    """Describe the first malformed branch decision in ``lines``."""
+
+    for raw_line in lines:
+        line = raw_line.strip()
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 2:
+            return TraceParseError(f"invalid trace line: {line}")
+        try:
+            int(parts[0])
+        except ValueError:  # pragma: no cover - defensive
+            return TraceParseError(f"invalid line number: {parts[0]}")
+        if parts[1] not in BRANCH_TOKENS:
+            return TraceParseError(f"branch token must be T or F: {parts[1]}")
+    return TraceParseError("invalid trace block")  # pragma: no cover - defensive
 
 
 def parse_trace_block(raw_output: str) -> ParsedTrace:
     """Extract the ```trace block from the model output and parse it."""
 
-    if '[/THINK]' in raw_output:
-        raw_output = raw_output[raw_output.rfind('[/THINK]'):]
+    think_end = raw_output.rfind('[/THINK]')
+    if think_end != -1:
+        raw_output = raw_output[think_end:]
 
-    match = TRACE_BLOCK_RE.search(raw_output)
-    if not match:
+    block = _find_trace_block(raw_output)
+    if block is None:
         raise TraceParseError("missing ```trace block")
 
-    contents = [line.strip() for line in match.group(1).splitlines() if line.strip()]
-    if not contents:
+    lines = block.splitlines()
+    for header_idx, raw_line in enumerate(lines):
+        header = raw_line.strip()
+        if header:
+            break
+    else:
         raise TraceParseError("empty trace block")
 
-    header = contents[0]
     if not header.lower().startswith("answer:"):
         raise TraceParseError("first line must be an answer declaration")
 
@@ -161,59 +236,77 @@ def parse_trace_block(raw_output: str) -> ParsedTrace:
     if answer not in {"reachable", "unreachable"}:
         raise TraceParseError(f"invalid answer token: {answer}")
 
-    decisions: List[TraceDecision] = []
-    for line in contents[1:]:
-        parts = line.split()
-        if len(parts) != 2:
-            raise TraceParseError(f"invalid trace line: {line}")
-        try:
-            cond_line = int(parts[0])
-        except ValueError as exc:  # pragma: no cover - defensive
-            raise TraceParseError(f"invalid line number: {parts[0]}") from exc
-        direction = parts[1].upper()
-        if direction not in {"T", "F"}:
-            raise TraceParseError(f"branch token must be T or F: {parts[1]}")
-        decisions.append((cond_line, direction))
+    # Fast path: one comprehension over the remaining non-blank lines.  A
+    # malformed line trips the unpacking, int() or the token lookup, and only
+    # then is the body re-scanned to report which line was bad.
+    body = lines[header_idx + 1:]
+    try:
+        decisions: List[TraceDecision] = [
+            (int(number), BRANCH_TOKENS[token])
+            for number, token in (parts for parts in map(str.split, body) if parts)
+        ]
+    except (ValueError, KeyError):
+        raise _invalid_decision_error(body) from None
 
     return ParsedTrace(answer=answer, decisions=decisions)
 
 
+# Directory holding the benchmark sources; resolved once since it never moves.
+_SCRIPT_DIR = Path(__file__).resolve().parent
+_SOURCE_CACHE: Dict[str, str] = {}
+
+
+def _read_source(root: Path, name: str) -> str:
+    """Return the text of ``root / name``, reading it from disk only once."""
+
+    path = root / name
+    key = str(path)
+    source = _SOURCE_CACHE.get(key)
+    if source is None:
+        source = _SOURCE_CACHE[key] = path.read_text(encoding="utf-8")
+    return source
+
+
 def _default_tasks() -> List[TraceTask]:
     """Load the built-in benchmark tasks from disk."""
 
-    root = Path(__file__).resolve().parent
+    root = _SCRIPT_DIR
     return [
         TraceTask(
             name="xor",
             file_name="xor.c",
             target_line=11,
-            source=(root / "xor.c").read_text(encoding="utf-8"),
+            source=_read_source(root, "xor.c"),
             verifier=verify_xor_trace,
+            batch_verifier=verify_xor_batch,
         ),
         TraceTask(
             name="dummy",
             file_name="dummy.c",
             target_line=8,
-            source=(root / "dummy.c").read_text(encoding="utf-8"),
+            source=_read_source(root, "dummy.c"),
             verifier=verify_dummy_trace,
         ),
         TraceTask(
             name="control_temp",
             file_name="control_temp.c",
             target_line=47,
-            source=(root / "control_temp.c").read_text(encoding="utf-8"),
+            source=_read_source(root, "control_temp.c"),
             verifier=verify_control_temp_trace,
+            batch_verifier=verify_control_temp_batch,
         ),
     ]
 
 
-def evaluate_trace(task: TraceTask, completion: str) -> TraceRewardResult:
-    """Parse ``completion`` and score it against ``task``'s verifier."""
+def _parse_for_scoring(
+    completion: str,
+) -> Tuple[Optional[ParsedTrace], Optional[TraceRewardResult]]:
+    """Parse ``completion``; also return the final result if it needs no verifier."""
 
     try:
         parsed = parse_trace_block(completion)
     except TraceParseError as exc:
-        return TraceRewardResult(
+        return None, TraceRewardResult(
             sat=False,
             reward=MIN_REWARD * 2,
             reason=f"parse error: {exc}",
@@ -222,14 +315,28 @@ def evaluate_trace(task: TraceTask, completion: str) -> TraceRewardResult:
 
     # TODO: Support unreachable
     if parsed.answer != "reachable":
-        return TraceRewardResult(
+        return parsed, TraceRewardResult(
             sat=False,
             reward=MIN_REWARD,
             reason="model predicted unreachable",
             parsed=parsed,
         )
 
-    verify_result = task.verifier(parsed.decisions, task.target_line)
+    # A reachable claim without a single branch decision cannot score.
+    if not parsed.decisions:
+        return parsed, TraceRewardResult(
+            sat=False,
+            reward=MIN_REWARD,
+            reason="empty trace",
+            parsed=parsed,
+        )
+
+    return parsed, None
+
+
+def _reward_from_verdict(
+    verify_result: Mapping[str, object], parsed: ParsedTrace
+) -> TraceRewardResult:
     sat = bool(verify_result.get("sat"))
     reward = float(verify_result.get("reward", MIN_REWARD))
     reason = str(verify_result.get("reason", ""))
@@ -237,6 +344,85 @@ def evaluate_trace(task: TraceTask, completion: str) -> TraceRewardResult:
     return TraceRewardResult(sat=sat, reward=reward, reason=reason, parsed=parsed)
 
 
+def evaluate_trace(task: TraceTask, completion: str) -> TraceRewardResult:
+    """Parse ``completion`` and score it against ``task``'s verifier."""
+
+    parsed, result = _parse_for_scoring(completion)
+    if result is not None:
+        return result
+
+    return _reward_from_verdict(task.verifier(parsed.decisions, task.target_line), parsed)
+
+
+# Distinct traces handed to one executor job by _verify_with_executor.
+_EXECUTOR_CHUNK_SIZE = 64
+
+
+def _verify_with_executor(
+    task: TraceTask, traces: Sequence[Sequence[TraceDecision]], executor: Executor
+) -> List[Mapping[str, object]]:
+    """Verify ``traces`` on ``executor``, sending each distinct trace only once."""
+
+    unique = list(dict.fromkeys(tuple(trace) for trace in traces))
+    chunks = [
+        unique[start:start + _EXECUTOR_CHUNK_SIZE]
+        for start in range(0, len(unique), _EXECUTOR_CHUNK_SIZE)
+    ]
+
+    verdicts: Dict[Tuple[TraceDecision, ...], Mapping[str, object]] = {}
+    if task.batch_verifier is not None:
+        futures = [executor.submit(task.batch_verifier, chunk, task.target_line) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            verdicts.update(zip(chunk, future.result()))
+    else:
+        verdicts.update(zip(unique, executor.map(
+            task.verifier, unique, repeat(task.target_line), chunksize=_EXECUTOR_CHUNK_SIZE
+        )))
+    return [verdicts[tuple(trace)] for trace in traces]
+
+
+def evaluate_trace_batch(
+    task: TraceTask,
+    completions: Sequence[str],
+    *,
+    executor: Optional[Executor] = None,
+) -> List[TraceRewardResult]:
+    """Score several ``completions`` for the same ``task`` with one verifier call.
+
+    Completions that fail to parse or predict unreachable are resolved
+    without the verifier; the rest go through ``task.batch_verifier`` when the
+    task provides one, falling back to ``task.verifier`` per trace.
+
+    With ``executor`` (e.g. a ``ProcessPoolExecutor``), the distinct traces are
+    split into chunks verified concurrently.  Each worker process imports the
+    verifier modules once, building their per-class truth tables, and keeps
+    them for the executor's lifetime, so reuse one executor across batches.
+    Verdicts depend only on the trace, so the results equal the sequential
+    ones.
+    """
+
+    results: List[Optional[TraceRewardResult]] = []
+    pending: List[Tuple[int, ParsedTrace]] = []
+    for position, completion in enumerate(completions):
+        parsed, result = _parse_for_scoring(completion)
+        results.append(result)
+        if result is None:
+            pending.append((position, parsed))
+
+    if pending:
+        traces = [parsed.decisions for _, parsed in pending]
+        if executor is not None:
+            verify_results = _verify_with_executor(task, traces, executor)
+        elif task.batch_verifier is not None:
+            verify_results = task.batch_verifier(traces, task.target_line)
+        else:
+            verify_results = [task.verifier(trace, task.target_line) for trace in traces]
+        for (position, parsed), verify_result in zip(pending, verify_results):
+            results[position] = _reward_from_verdict(verify_result, parsed)
+
+    return results  # type: ignore[return-value]
+
+
 class TraceRLEnvironment:
     """Utility wrapper for sampling tasks and scoring model outputs."""
 
@@ -249,6 +435,7 @@ class TraceRLEnvironment:
         self._tasks: Tuple[TraceTask, ...] = tuple(tasks or _default_tasks())
         if not self._tasks:
             raise ValueError("at least one task is required")
+        self._task_indices = range(len(self._tasks))
         self.system_prompt = system_prompt
 
     def __len__(self) -> int:  # pragma: no cover - trivial
@@ -269,9 +456,49 @@ class TraceRLEnvironment:
         idx = rng.randrange(len(self._tasks))
         return idx, self.build_messages(idx)
 
+    def sample_batch(
+        self, n: int, rng: Optional[random.Random] = None
+    ) -> List[Tuple[int, List[Dict[str, str]]]]:
+        """Return ``n`` (task_index, chat_messages) pairs drawn with replacement."""
+
+        rng = rng or random
+        return [(idx, self.build_messages(idx)) for idx in rng.choices(self._task_indices, k=n)]
+
     def evaluate(self, task_index: int, completion: str) -> TraceRewardResult:
         return evaluate_trace(self._tasks[task_index], completion)
 
+    def evaluate_batch(
+        self,
+        task_indices: Sequence[int],
+        completions: Sequence[str],
+        *,
+        executor: Optional[Executor] = None,
+    ) -> List[TraceRewardResult]:
+        """Score ``completions[i]`` against task ``task_indices[i]`` for every i.
+
+        Completions are grouped per task so each task's verifier sees its whole
+        share of the batch at once; results come back in the input order.
+        ``executor`` is forwarded to :func:`evaluate_trace_batch`.
+        """
+
+        if len(task_indices) != len(completions):
+            raise ValueError("task_indices and completions must have the same length")
+
+        positions_by_task: Dict[int, List[int]] = {}
+        for position, task_index in enumerate(task_indices):
+            positions_by_task.setdefault(task_index, []).append(position)
+
+        results: List[Optional[TraceRewardResult]] = [None] * len(completions)
+        for task_index, positions in positions_by_task.items():
+            task_results = evaluate_trace_batch(
+                self._tasks[task_index],
+                [completions[position] for position in positions],
+                executor=executor,
+            )
+            for position, result in zip(positions, task_results):
+                results[position] = result
+        return results  # type: ignore[return-value]
+
 
 def preview_environment(sample_seed: Optional[int] = None) -> None:
     """Quick manual smoke test for the environment."""
@@ -1,28 +1,84 @@
-import json
-import subprocess
-from pathlib import Path
-from z3 import Ints, Solver, And, Or, Not, sat
+from types import MappingProxyType
 
-from .reward_utils import branch_truth_from_coverage, trace_f1
+from . import xor
+from .reward_utils import branch_truth_from_coverage, collect_executed_lines, trace_f1
 
 MIN_REWARD = -1.0
 
-def convert_c_lines_to_py_lines(trace):
+# Shared fields of every rejected verdict; each return adds its reason.
+_REJECTED = MappingProxyType({'sat': False, 'reward': MIN_REWARD})
+
+# Line of each if in xor.c -> the same if in xor.py
+_C_TO_PY = MappingProxyType({
+    5: 5,
+    7: 7,
+    10: 9,
+})
+_DIRECTIONS = ('T', 'F')
+
+def _invalid_literal(trace):
     """
-    trace: list[(line, dir)], dir in {'T', 'F'}
-    return: list[(line, dir)], dir in {'T', 'F'}
+    trace: list[(line, dir)] of xor.c lines
+    return: reason for the first literal that is not an if line / direction, or None
     """
-    C_TO_PY = {
-        5: 5,
-        7: 7,
-        10: 9,
-    }
-    result = []
+
     for ln, d in trace:
-        if ln not in C_TO_PY:
-            raise RuntimeError(f'line {ln} is not an if')
-        result.append((C_TO_PY[ln], d))
-    return result
+        if ln not in _C_TO_PY:
+            return f'line {ln} is not an if'
+        if d not in _DIRECTIONS:
+            return f'invalid direction {d!r} at line {ln}'
+    return None
+
+
+# xor.py reduces both inputs mod 2, so only four models (a, b) exist.  Each
+# condition is the 4-bit set of models satisfying it (bit i <-> _MODELS[i]),
+# and a trace is satisfiable iff the AND of its literals' sets is non-empty.
+_MODELS = ((0, 0), (0, 1), (1, 0), (1, 1))
+_ALL_MODELS = 0b1111
+
+_COND_MASKS = {
+    5: 0b1000,  # a and b
+    7: 0b0001,  # not a and not b
+    9: 0b1001,  # ret, i.e. cond5 or cond7
+}
+_TARGET_MASKS = {
+    11: _COND_MASKS[9],
+}
+
+# If entered the if, i.e., the next line, set it to Taken
+_TRUE_LINE_MAP = MappingProxyType({
+    5: 6,
+    7: 8,
+    9: 10,
+})
+
+# Branch outcomes of each model, traced once at import.
+_TRUTH_TABLE = {
+    model: branch_truth_from_coverage(
+        collect_executed_lines(xor.xor, *model),
+        _TRUE_LINE_MAP,
+    )
+    for model in _MODELS
+}
+
+
+def _solve(trace, target_line):
+    """
+    trace: list[(line, dir)] of xor.py lines, dir in {'T', 'F'}
+    target_line: supported target line
+    return: (sat: bool, a: int or None, b: int or None)
+    """
+
+    models = _TARGET_MASKS[target_line]
+    for ln, d in trace:
+        cond = _COND_MASKS[ln]
+        models &= cond if d == 'T' else _ALL_MODELS ^ cond
+        if not models:
+            return False, None, None
+
+    # Any surviving model is a witness; take the lowest one.
+    a, b = _MODELS[(models & -models).bit_length() - 1]
+    return True, a, b
 
 
 def verify_trace(trace, target_line=11):
@@ -32,110 +88,26 @@ def verify_trace(trace, target_line=11):
     return: dict(sat: bool, reward: float, reason: str)
     """
 
+    if not trace:
+        return {**_REJECTED, 'reason': 'empty trace'}
+
     # 1. invalid if lines
-    try:
-        trace = convert_c_lines_to_py_lines(trace)
-    except RuntimeError as e:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': str(e)
-        }
-
-    s = Solver()
-
-    a, b = Ints('a b')
-    s.add(a >= 0, a <= 1)
-    s.add(b >= 0, b <= 1)
-
-    cond5 = And(a == 1, b == 1)
-    cond7 = And(a == 0, b == 0)
-    cond9 = Or(cond5, cond7)
-
-    cond_map = {
-        5: cond5,
-        7: cond7,
-        9: cond9,
-    }
+    reason = _invalid_literal(trace)
+    if reason is not None:
+        return {**_REJECTED, 'reason': reason}
+    trace = [(_C_TO_PY[ln], d) for ln, d in trace]
 
-    for ln, d in trace:
-        cond = cond_map[ln]
-        if d == 'T':
-            s.add(cond)
-        else:
-            s.add(Not(cond))
-
-    if target_line == 11:
-        s.add(cond9)
-    else:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': f'unsupported target line {target_line}'
-        }
+    if target_line not in _TARGET_MASKS:
+        return {**_REJECTED, 'reason': f'unsupported target line {target_line}'}
 
     # 5. SAT / UNSAT
-    if s.check() != sat:
-        return {
-            'sat': False,
-            'reward': MIN_REWARD,
-            'reason': 'unsatisfiable trace'
-        }
-
-    # 6. coverage based method scoring (f1)
-
-    m = s.model()
-    a_val = m[a].as_long()
-    b_val = m[b].as_long()
-
-    script_dir = Path(__file__).resolve().parent
-    coverage_file = script_dir / '.coverage'
-    coverage_json = script_dir / 'coverage.json'
-    xor_py = script_dir / 'xor.py'
-
-    coverage_file.unlink(missing_ok=True)
-    coverage_json.unlink(missing_ok=True)
-
-    try:
-        subprocess.run(
-            ['coverage', 'run', str(xor_py), str(a_val), str(b_val)],
-            check=True,
-            cwd=script_dir,
-        )
-        subprocess.run(['coverage', 'json'], check=True, cwd=script_dir)
-    except subprocess.CalledProcessError as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'coverage failed: {exc}',
-        }
-
-    if not coverage_json.exists():
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': 'coverage report missing',
-        }
-
-    try:
-        with coverage_json.open('r', encoding='utf-8') as fp:
-            data = json.load(fp)
-        executed_lines = set(data['files']['xor.py']['executed_lines'])
-    except (OSError, KeyError, json.JSONDecodeError) as exc:
-        return {
-            'sat': True,
-            'reward': MIN_REWARD,
-            'reason': f'failed to parse coverage: {exc}',
-        }
-
-    # If entered the if, i.e., the next line, set it to Taken
-    true_line_map = {
-        5: 6,
-        7: 8,
-        9: 10,
-    }
+    is_sat, a_val, b_val = _solve(trace, target_line)
+    if not is_sat:
+        return {**_REJECTED, 'reason': 'unsatisfiable trace'}
 
-    actual_truth = branch_truth_from_coverage(executed_lines, true_line_map)
+    # 6. coverage based method scoring (f1), looked up per model
+
+    actual_truth = _TRUTH_TABLE[(a_val, b_val)]
     reward = trace_f1(trace, actual_truth)
 
     return {
@@ -144,6 +116,26 @@ def verify_trace(trace, target_line=11):
         'reason': 'ok'
     }
 
+
+def verify_batch(traces, target_line=11):
+    """
+    traces: list of traces, each list[(line, dir)], dir in {'T', 'F'}
+    target_line: target line
+    return: list[dict(sat: bool, reward: float, reason: str)], in input order
+    """
+
+    # Traces in a batch repeat heavily, so each distinct one is folded once
+    # and every occurrence gets its own copy of that verdict.
+    verdicts = {}
+    results = []
+    for trace in traces:
+        key = tuple((ln, d) for ln, d in trace)
+        verdict = verdicts.get(key)
+        if verdict is None:
+            verdict = verdicts[key] = verify_trace(key, target_line)
+        results.append(dict(verdict))
+    return results
+
 if __name__ == '__main__':
     print(verify_trace(
         [